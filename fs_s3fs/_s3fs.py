@@ -4,22 +4,35 @@ from __future__ import unicode_literals
 
 __all__ = ["S3FS"]
 
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import contextlib
 from datetime import datetime
+import functools
 import io
 import itertools
 import os
+import re
 from ssl import SSLError
 import tempfile
 import threading
+import time
 import mimetypes
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, EndpointConnectionError
 
 import six
 from six import text_type
 
+try:
+    from boto3.s3.transfer import create_transfer_manager
+except ImportError:  # pragma: no cover
+    # Older Boto3 always uses the s3transfer manager
+    from s3transfer.manager import TransferManager as create_transfer_manager
+
 from fs import ResourceType
 from fs.base import FS
 from fs.info import Info
@@ -30,6 +43,56 @@ from fs.path import basename, dirname, forcedir, join, normpath, relpath
 from fs.time import datetime_to_epoch
 
 
+_monotonic = getattr(time, "monotonic", time.time)
+
+_CLIENT_CONFIG = Config(
+    max_pool_connections=64, retries={"mode": "adaptive", "max_attempts": 10}
+)
+
+# Matches absolute paths that are already normalized, with no empty,
+# "." or ".." components and no trailing slash
+_match_normal_path = re.compile(r"(?:/(?!\.\.?(?:/|$))[^/]+)+\Z").match
+
+# Cached in place of a list entry for a key that doesn't exist
+_NOT_FOUND = object()
+
+# Most recently used clients last; old clients are dropped so credentials
+# that have been rotated out don't keep their connection pools alive
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+_MAX_CLIENTS = 16
+
+
+def _get_client(**params):
+    """Get a shared S3 client for the given connection parameters.
+
+    boto3 clients are thread-safe, so a single client (and its connection
+    pool) is shared by every filesystem and thread with the same
+    parameters, rather than paying for a new one in each thread. Like
+    ``boto3.client``, clients are made from Boto3's default session, which
+    loads the service model and resolves default credentials only once.
+
+    """
+    with _clients_lock:
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+        # A new default session gets new clients
+        key = (session,) + tuple(sorted(params.items()))
+        client = _clients.pop(key, None)
+        if client is None:
+            client = session.client("s3", config=_CLIENT_CONFIG, **params)
+        _clients[key] = client
+        while len(_clients) > _MAX_CLIENTS:
+            _clients.popitem(last=False)
+    return client
+
+
+if os.environ.get("S3FS_PRELOAD", "").lower() in ("1", "true"):
+    # Parse the S3 service model at import rather than in the first request
+    _get_client().meta.service_model.operation_model("GetObject")
+
+
 def _make_repr(class_name, *args, **kwargs):
     """
     Generate a repr string.
@@ -57,13 +120,62 @@ def _make_repr(class_name, *args, **kwargs):
     return "{}({})".format(class_name, ", ".join(arguments))
 
 
+class _InfoCache(object):
+    """A thread-safe LRU cache with expiring entries."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                return default
+            if expires <= _monotonic():
+                del self._entries[key]
+                return default
+            del self._entries[key]
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (_monotonic() + self.ttl, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
 class S3File(io.IOBase):
     """Proxy for a S3 file."""
 
     @classmethod
-    def factory(cls, filename, mode, on_close):
-        """Create a S3File backed with a temporary file."""
-        _temp_file = tempfile.TemporaryFile()
+    def factory(
+        cls, filename, mode, on_close, spool_size=8 * 1024 * 1024, temp_dir=None
+    ):
+        """Create a S3File backed with a temporary file.
+
+        The file is kept in memory until it grows beyond ``spool_size``
+        bytes, and then moved to a file in ``temp_dir``.
+
+        """
+        _temp_file = tempfile.SpooledTemporaryFile(
+            max_size=spool_size, mode="w+b", dir=temp_dir
+        )
         proxy = cls(_temp_file, filename, mode, on_close=on_close)
         return proxy
 
@@ -151,7 +263,15 @@ class S3File(io.IOBase):
         return self._f.readall()
 
     def readinto(self, b):
-        return self._f.readinto()
+        if not self.__mode.reading:
+            raise IOError("not open for reading")
+        try:
+            return self._f.readinto(b)
+        except AttributeError:
+            # SpooledTemporaryFile has no readinto before Python 3.11
+            data = self._f.read(len(b))
+            b[: len(data)] = data
+            return len(data)
 
     def write(self, b):
         if not self.__mode.writing:
@@ -163,9 +283,57 @@ class S3File(io.IOBase):
         if size is None:
             size = self._f.tell()
         self._f.truncate(size)
+        # An in-memory buffer won't grow on truncate, unlike a real file
+        pos = self._f.tell()
+        self._f.seek(0, os.SEEK_END)
+        end = self._f.tell()
+        if end < size:
+            self._f.write(b"\0" * (size - end))
+        self._f.seek(pos)
         return size
 
 
+class _BufferFile(io.RawIOBase):
+    """A writable file over a preallocated buffer.
+
+    Writes past the end of the buffer raise ``ValueError``. The ``end``
+    attribute is the furthest offset written to.
+
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._pos = 0
+        self.end = 0
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def write(self, b):
+        start = self._pos
+        end = start + len(b)
+        if end > len(self._view):
+            raise ValueError("write past end of buffer")
+        self._view[start:end] = b
+        self._pos = end
+        self.end = max(self.end, end)
+        return len(b)
+
+
 @contextlib.contextmanager
 def s3errors(path):
     """Translate S3 errors to FSErrors."""
@@ -221,6 +389,20 @@ class S3FS(FS):
         for details.
     :param dict download_args: Dictionary of extra arguments passed to
         the S3 client.
+    :param int max_workers: Maximum number of threads used to issue
+        concurrent requests to S3.
+    :param float info_cache_ttl: Number of seconds to remember the
+        result of looking up a path, or ``0`` to disable the cache. Changes
+        made through this filesystem are always visible immediately.
+    :param bool cache_not_found: Also remember paths that were found not
+        to exist, for ``info_cache_ttl`` seconds. This saves requests when
+        checking for the same missing paths repeatedly, but files created
+        by other clients may not be seen until the entry expires.
+    :param int spool_size: Size in bytes up to which open files are
+        buffered in memory before spilling to a temporary file on disk.
+    :param list cache_dirs: Existing directories to create spilled
+        temporary files in, used in turn, or ``None`` to use the system's
+        temporary directory.
 
     """
 
@@ -234,32 +416,33 @@ class S3FS(FS):
         "virtual": False,
     }
 
-    _object_attributes = [
-        "accept_ranges",
-        "cache_control",
-        "content_disposition",
-        "content_encoding",
-        "content_language",
-        "content_length",
-        "content_type",
-        "delete_marker",
-        "e_tag",
-        "expiration",
-        "expires",
-        "last_modified",
-        "metadata",
-        "missing_meta",
-        "parts_count",
-        "replication_status",
-        "request_charged",
-        "restore",
-        "server_side_encryption",
-        "sse_customer_algorithm",
-        "sse_customer_key_md5",
-        "ssekms_key_id",
-        "storage_class",
-        "version_id",
-        "website_redirect_location",
+    # Info key in the s3 namespace, HeadObject field, and whether it's a datetime
+    _S3_ATTR_TABLE = [
+        ("accept_ranges", "AcceptRanges", False),
+        ("cache_control", "CacheControl", False),
+        ("content_disposition", "ContentDisposition", False),
+        ("content_encoding", "ContentEncoding", False),
+        ("content_language", "ContentLanguage", False),
+        ("content_length", "ContentLength", False),
+        ("content_type", "ContentType", False),
+        ("delete_marker", "DeleteMarker", False),
+        ("e_tag", "ETag", False),
+        ("expiration", "Expiration", False),
+        ("expires", "Expires", True),
+        ("last_modified", "LastModified", True),
+        ("metadata", "Metadata", False),
+        ("missing_meta", "MissingMeta", False),
+        ("parts_count", "PartsCount", False),
+        ("replication_status", "ReplicationStatus", False),
+        ("request_charged", "RequestCharged", False),
+        ("restore", "Restore", False),
+        ("server_side_encryption", "ServerSideEncryption", False),
+        ("sse_customer_algorithm", "SSECustomerAlgorithm", False),
+        ("sse_customer_key_md5", "SSECustomerKeyMD5", False),
+        ("ssekms_key_id", "SSEKMSKeyId", False),
+        ("storage_class", "StorageClass", False),
+        ("version_id", "VersionId", False),
+        ("website_redirect_location", "WebsiteRedirectLocation", False),
     ]
 
     def __init__(
@@ -277,6 +460,11 @@ class S3FS(FS):
         acl=None,
         upload_args=None,
         download_args=None,
+        max_workers=32,
+        info_cache_ttl=2.0,
+        cache_not_found=False,
+        spool_size=8 * 1024 * 1024,
+        cache_dirs=None,
     ):
         _creds = (aws_access_key_id, aws_secret_access_key)
         if any(_creds) and not all(_creds):
@@ -284,6 +472,12 @@ class S3FS(FS):
                 "aws_access_key_id and aws_secret_access_key "
                 "must be set together if specified"
             )
+        cache_dirs = list(cache_dirs) if cache_dirs else None
+        for cache_dir in cache_dirs or ():
+            if not os.path.isdir(cache_dir):
+                raise errors.CreateFailed(
+                    "cache dir '{}' is not a directory".format(cache_dir)
+                )
         self._bucket_name = bucket_name
         self.dir_path = dir_path
         self._prefix = relpath(normpath(dir_path)).rstrip("/")
@@ -295,6 +489,18 @@ class S3FS(FS):
         self.delimiter = delimiter
         self.strict = strict
         self._tlocal = threading.local()
+        self.__client = None
+        self.max_workers = max_workers
+        self.__executor = None
+        self._executor_lock = threading.Lock()
+        self._transfer_managers = {}
+        self._transfer_managers_lock = threading.Lock()
+        self._info_cache = _InfoCache(maxsize=4096, ttl=info_cache_ttl)
+        self.cache_not_found = cache_not_found
+        self._lookups = {}
+        self._lookups_lock = threading.Lock()
+        self._valid_paths = OrderedDict()
+        self._valid_paths_lock = threading.Lock()
         if cache_control or acl:
             upload_args = upload_args or {}
             if cache_control:
@@ -303,6 +509,33 @@ class S3FS(FS):
                 upload_args["ACL"] = acl
         self.upload_args = upload_args
         self.download_args = download_args
+        self.spool_size = spool_size
+        self.cache_dirs = cache_dirs
+        self._cache_dir_cycle = itertools.cycle(self.cache_dirs or [None])
+        self._cache_dir_lock = threading.Lock()
+        self._transfer_config = TransferConfig(
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=20 * 1024 * 1024,
+            max_concurrency=10,
+            use_threads=True,
+        )
+        # Ranged GETs of 16MiB keep each connection busy without
+        # holding too much of an object in flight at once
+        self._download_config = TransferConfig(
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=16 * 1024 * 1024,
+            max_concurrency=10,
+            use_threads=True,
+        )
+        self._copy_config = TransferConfig(
+            multipart_threshold=4 * 1024 * 1024 * 1024,
+            multipart_chunksize=256 * 1024 * 1024,
+            max_concurrency=10,
+            use_threads=True,
+        )
+        # The CRT transfer manager can't copy, so always use the classic
+        # one (older Boto3 has no CRT support and ignores this)
+        self._copy_config.preferred_transfer_client = "classic"
         super(S3FS, self).__init__()
 
     def __repr__(self):
@@ -317,40 +550,214 @@ class S3FS(FS):
     def __str__(self):
         return "<s3fs '{}'>".format(join(self._bucket_name, relpath(self.dir_path)))
 
+    def close(self):
+        if getattr(self, "_lock", None) is None:
+            # __init__ failed, so there is nothing to clean up
+            return
+        with self._executor_lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        with self._transfer_managers_lock:
+            managers = list(self._transfer_managers.values())
+            self._transfer_managers.clear()
+        # Shutting down waits for transfers, so don't hold a lock meanwhile
+        for manager in managers:
+            manager.shutdown()
+        super(S3FS, self).close()
+
+    def validatepath(self, path):
+        # Validating a path only depends on the path, so remember the
+        # results for the most recently validated paths.
+        self.check()
+        valid_path = self._valid_paths.get(path)
+        if valid_path is None or not isinstance(path, text_type):
+            valid_path = super(S3FS, self).validatepath(path)
+            with self._valid_paths_lock:
+                self._valid_paths[path] = valid_path
+                if len(self._valid_paths) > 1024:
+                    self._valid_paths.popitem(last=False)
+        return valid_path
+
     def _path_to_key(self, path):
         """Converts an fs path to a s3 key."""
-        _path = relpath(normpath(path))
-        _key = (
-            "{}/{}".format(self._prefix, _path).lstrip("/").replace("/", self.delimiter)
-        )
+        if _match_normal_path(path):
+            _key = self._prefix + path if self._prefix else path[1:]
+        else:
+            _path = relpath(normpath(path))
+            _key = "{}/{}".format(self._prefix, _path).lstrip("/")
+        if self.delimiter != "/":
+            _key = _key.replace("/", self.delimiter)
         return _key
 
     def _path_to_dir_key(self, path):
         """Converts an fs path to a s3 key."""
-        _path = relpath(normpath(path))
-        _key = (
-            forcedir("{}/{}".format(self._prefix, _path))
-            .lstrip("/")
-            .replace("/", self.delimiter)
-        )
+        if _match_normal_path(path):
+            _key = (self._prefix + path if self._prefix else path[1:]) + "/"
+        else:
+            _path = relpath(normpath(path))
+            _key = forcedir("{}/{}".format(self._prefix, _path)).lstrip("/")
+        if self.delimiter != "/":
+            _key = _key.replace("/", self.delimiter)
         return _key
 
     def _key_to_path(self, key):
+        if self.delimiter == "/":
+            return key
         return key.replace(self.delimiter, "/")
 
     def _get_object(self, path, key):
+        """Look up the file or directory at ``key`` with a single listing.
+
+        Returns the list objects entry for a file, or an entry with a key
+        ending in the delimiter for a directory. Concurrent lookups of the
+        same key share a single request. Keys found to be missing are
+        only remembered if ``cache_not_found`` was set.
+
+        """
         _key = key.rstrip(self.delimiter)
+        obj = self._info_cache.get(_key)
+        if obj is _NOT_FOUND:
+            raise errors.ResourceNotFound(path)
+        if obj is not None:
+            return obj
+        with self._lookups_lock:
+            future = self._lookups.get(_key)
+            leader = future is None
+            if leader:
+                future = self._lookups[_key] = Future()
+        if not leader:
+            try:
+                obj = future.result()
+            except errors.ResourceNotFound:
+                raise errors.ResourceNotFound(path)
+            if obj is None:
+                # The other lookup was interrupted, so make our own
+                return self._get_object(path, key)
+            return obj
         try:
-            with s3errors(path):
-                obj = self.s3.Object(self._bucket_name, _key)
-                obj.load()
-        except errors.ResourceNotFound:
-            with s3errors(path):
-                obj = self.s3.Object(self._bucket_name, _key + self.delimiter)
-                obj.load()
+            obj = self._lookup_object(path, _key)
+        except BaseException as error:
+            not_found = isinstance(error, errors.ResourceNotFound)
+            self._end_lookup(
+                _key, future, _NOT_FOUND if self.cache_not_found and not_found else None
+            )
+            if isinstance(error, Exception):
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+            raise
+        self._end_lookup(_key, future, obj)
+        future.set_result(obj)
+        return obj
+
+    def _end_lookup(self, key, future, obj):
+        """Finish the in-flight lookup of a key, and cache what it found.
+
+        Nothing is cached if the key was invalidated during the lookup,
+        as the result may predate the change.
+
+        """
+        with self._lookups_lock:
+            if self._lookups.get(key) is future:
+                del self._lookups[key]
+                if obj is not None:
+                    self._info_cache.set(key, obj)
+
+    def _lookup_object(self, path, key):
+        """Find the list objects entry for ``key`` in S3."""
+        _key = key
+        _dir_key = _key + self.delimiter
+        with s3errors(path):
+            response = self.client.list_objects_v2(
+                Bucket=self._bucket_name,
+                Prefix=_key,
+                Delimiter=self.delimiter,
+                MaxKeys=2,
+                FetchOwner=False,
+            )
+        for obj in response.get("Contents", ()):
+            if obj["Key"] == _key:
                 return obj
-        else:
-            return obj
+        # The listing only shows the directory's prefix, so it's up to
+        # _getinfo to fetch the marker's details if they're needed
+        for prefix in response.get("CommonPrefixes", ()):
+            if prefix["Prefix"] == _dir_key:
+                return {"Key": _dir_key}
+        if response.get("IsTruncated", False):
+            # Sibling keys such as "foo.txt" sort ahead of "foo/"
+            entry = self._lookup_dir_marker(path, _dir_key)
+            if entry is not None:
+                return entry
+        raise errors.ResourceNotFound(path)
+
+    def _lookup_dir_marker(self, path, dir_key):
+        """Find the list objects entry for a directory's marker object.
+
+        Returns an entry with just the key for a directory implied by the
+        keys beneath it, or ``None`` if there are no keys under it at all.
+
+        """
+        with s3errors(path):
+            response = self.client.list_objects_v2(
+                Bucket=self._bucket_name,
+                Prefix=dir_key,
+                MaxKeys=1,
+                FetchOwner=False,
+            )
+        for obj in response.get("Contents", ()):
+            if obj["Key"] == dir_key:
+                return obj
+            return {"Key": dir_key}
+        return None
+
+    def _invalidate(self, key):
+        """Forget cached lookups of a key that changed, and its parents.
+
+        Parents are included as a directory implied by its contents comes
+        and goes with them.
+
+        """
+        _key = key.rstrip(self.delimiter)
+        with self._lookups_lock:
+            while _key:
+                self._info_cache.pop(_key)
+                # Later lookups mustn't join one that started before now
+                self._lookups.pop(_key, None)
+                _key = _key.rpartition(self.delimiter)[0]
+
+    def _upload_file(self, path, key, file):
+        """Upload the whole of a seekable file to ``key``."""
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(0, os.SEEK_SET)
+        with s3errors(path):
+            if size < self._transfer_config.multipart_threshold:
+                # Too small for a multipart upload, so skip the transfer manager
+                self.client.put_object(
+                    Bucket=self._bucket_name,
+                    Key=key,
+                    Body=file,
+                    **self._get_upload_args(key)
+                )
+            else:
+                self._transfer_manager(self._transfer_config).upload(
+                    file, self._bucket_name, key, extra_args=self._get_upload_args(key)
+                ).result()
+        self._invalidate(key)
+
+    def _download_file(self, key, file):
+        """Download the object at ``key`` in to a file."""
+        self._transfer_manager(self._download_config).download(
+            self._bucket_name, key, file, extra_args=self.download_args
+        ).result()
+
+    def _load_object(self, path, key):
+        """Get the HeadObject response for a key, with the key added."""
+        with s3errors(path):
+            obj = self.client.head_object(Bucket=self._bucket_name, Key=key)
+        obj["Key"] = key
+        return obj
 
     def _get_upload_args(self, key):
         upload_args = self.upload_args.copy() if self.upload_args else {}
@@ -361,35 +768,66 @@ class S3FS(FS):
             upload_args["ContentType"] = mime_type or "binary/octet-stream"
         return upload_args
 
+    def _next_cache_dir(self):
+        """Get the directory for the next open file to spill to."""
+        with self._cache_dir_lock:
+            return next(self._cache_dir_cycle)
+
+    @property
+    def _executor(self):
+        """Thread pool used to run independent S3 requests concurrently."""
+        with self._executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self.__executor
+
+    def _transfer_manager(self, config):
+        """Get the transfer manager for a transfer config.
+
+        Managers are kept for the life of the filesystem, so transfers
+        reuse their worker threads rather than starting new ones.
+
+        """
+        with self._transfer_managers_lock:
+            manager = self._transfer_managers.get(config)
+            if manager is None:
+                manager = create_transfer_manager(self.client, config)
+                self._transfer_managers[config] = manager
+            return manager
+
     @property
     def s3(self):
-        if not hasattr(self._tlocal, "s3"):
-            self._tlocal.s3 = boto3.resource(
+        # boto3 resources are not thread-safe, so unlike the client each
+        # thread gets its own; S3FS itself only uses the shared client.
+        try:
+            return self._tlocal.s3
+        except AttributeError:
+            s3 = self._tlocal.s3 = boto3.resource(
                 "s3",
                 region_name=self.region,
                 aws_access_key_id=self.aws_access_key_id,
                 aws_secret_access_key=self.aws_secret_access_key,
                 aws_session_token=self.aws_session_token,
                 endpoint_url=self.endpoint_url,
+                config=_CLIENT_CONFIG,
             )
-        return self._tlocal.s3
+            return s3
 
     @property
     def client(self):
-        if not hasattr(self._tlocal, "client"):
-            self._tlocal.client = boto3.client(
-                "s3",
+        if self.__client is None:
+            self.__client = _get_client(
                 region_name=self.region,
                 aws_access_key_id=self.aws_access_key_id,
                 aws_secret_access_key=self.aws_secret_access_key,
                 aws_session_token=self.aws_session_token,
                 endpoint_url=self.endpoint_url,
             )
-        return self._tlocal.client
+        return self.__client
 
-    def _info_from_object(self, obj, namespaces):
-        """Make an info dict from an s3 Object."""
-        key = obj.key
+    def _info_from_head_response(self, obj, namespaces):
+        """Make an info dict from a HeadObject response."""
+        key = obj["Key"]
         path = self._key_to_path(key)
         name = basename(path.rstrip("/"))
         is_dir = key.endswith(self.delimiter)
@@ -398,17 +836,53 @@ class S3FS(FS):
             _type = int(ResourceType.directory if is_dir else ResourceType.file)
             info["details"] = {
                 "accessed": None,
-                "modified": datetime_to_epoch(obj.last_modified),
-                "size": obj.content_length,
+                "modified": datetime_to_epoch(obj["LastModified"]),
+                "size": obj["ContentLength"],
                 "type": _type,
             }
         if "s3" in namespaces:
             s3info = info["s3"] = {}
-            for name in self._object_attributes:
-                value = getattr(obj, name, None)
-                if isinstance(value, datetime):
+            for info_key, obj_key, is_datetime in self._S3_ATTR_TABLE:
+                value = obj.get(obj_key)
+                if is_datetime and isinstance(value, datetime):
                     value = datetime_to_epoch(value)
-                s3info[name] = value
+                s3info[info_key] = value
+        if "urls" in namespaces:
+            url = self.client.generate_presigned_url(
+                ClientMethod="get_object",
+                Params={"Bucket": self._bucket_name, "Key": key},
+            )
+            info["urls"] = {"download": url}
+        return info
+
+    def _info_from_list_entry(self, entry, namespaces):
+        """Make an info dict from an entry in a list objects response."""
+        key = entry["Key"]
+        path = self._key_to_path(key)
+        name = basename(path.rstrip("/"))
+        is_dir = key.endswith(self.delimiter)
+        info = {"basic": {"name": name, "is_dir": is_dir}}
+        last_modified = entry.get("LastModified")
+        if last_modified is not None:
+            last_modified = datetime_to_epoch(last_modified)
+        if "details" in namespaces:
+            _type = int(ResourceType.directory if is_dir else ResourceType.file)
+            info["details"] = {
+                "accessed": None,
+                "modified": last_modified,
+                "size": entry.get("Size", 0),
+                "type": _type,
+            }
+        if "s3" in namespaces:
+            s3info = info["s3"] = {
+                info_key: None for info_key, _, _ in self._S3_ATTR_TABLE
+            }
+            s3info.update(
+                content_length=entry.get("Size", 0),
+                e_tag=entry.get("ETag"),
+                last_modified=last_modified,
+                storage_class=entry.get("StorageClass"),
+            )
         if "urls" in namespaces:
             url = self.client.generate_presigned_url(
                 ClientMethod="get_object",
@@ -417,6 +891,24 @@ class S3FS(FS):
             info["urls"] = {"download": url}
         return info
 
+    def _check_file_destination(self, path, exclusive=False):
+        """Check a file may be written to ``path``.
+
+        The path is looked up first, since an existing object proves its
+        parent directory exists; the parent is only checked for new files.
+
+        """
+        try:
+            info = self._getinfo(path)
+        except errors.ResourceNotFound:
+            if not self.isdir(dirname(self.validatepath(path))):
+                raise errors.ResourceNotFound(path)
+        else:
+            if exclusive:
+                raise errors.FileExists(path)
+            if info.is_dir:
+                raise errors.FileExpected(path)
+
     def isdir(self, path):
         _path = self.validatepath(path)
         try:
@@ -426,34 +918,15 @@ class S3FS(FS):
 
     def getinfo(self, path, namespaces=None):
         self.check()
-        namespaces = namespaces or ()
-        _path = self.validatepath(path)
-        _key = self._path_to_key(_path)
+        return self._getinfo(path, namespaces=namespaces)
 
-        try:
-            dir_path = dirname(_path)
-            if dir_path != "/":
-                _dir_key = self._path_to_dir_key(dir_path)
-                with s3errors(path):
-                    obj = self.s3.Object(self._bucket_name, _dir_key)
-                    obj.load()
-        except errors.ResourceNotFound:
-            raise errors.ResourceNotFound(path)
-
-        if _path == "/":
-            return Info(
-                {
-                    "basic": {"name": "", "is_dir": True},
-                    "details": {"type": int(ResourceType.directory)},
-                }
-            )
+    def _getinfo(self, path, namespaces=None):
+        """Gets info without checking the filesystem is open.
 
-        obj = self._get_object(path, _key)
-        info = self._info_from_object(obj, namespaces)
-        return Info(info)
+        A successful lookup also proves the parent directory exists, as
+        the object's key lies under the parent's prefix.
 
-    def _getinfo(self, path, namespaces=None):
-        """Gets info without checking for parent dir."""
+        """
         namespaces = namespaces or ()
         _path = self.validatepath(path)
         _key = self._path_to_key(_path)
@@ -465,32 +938,43 @@ class S3FS(FS):
                 }
             )
 
-        obj = self._get_object(path, _key)
-        info = self._info_from_object(obj, namespaces)
-        return Info(info)
+        entry = self._get_object(path, _key)
+        is_dir = entry["Key"].endswith(self.delimiter)
+        if "details" in namespaces and is_dir and "LastModified" not in entry:
+            # Report the marker's modified time, if there is a marker
+            entry = self._lookup_dir_marker(path, entry["Key"]) or entry
+        if "s3" in namespaces:
+            try:
+                obj = self._load_object(path, entry["Key"])
+            except errors.ResourceNotFound:
+                # A directory implied by its contents has no marker object
+                if not is_dir:
+                    raise
+            else:
+                return Info(self._info_from_head_response(obj, namespaces))
+        return Info(self._info_from_list_entry(entry, namespaces))
 
     def listdir(self, path):
         _path = self.validatepath(path)
         _s3_key = self._path_to_dir_key(_path)
         prefix_len = len(_s3_key)
 
-        paginator = self.client.get_paginator("list_objects")
-        with s3errors(path):
-            _paginate = paginator.paginate(
-                Bucket=self._bucket_name, Prefix=_s3_key, Delimiter=self.delimiter
-            )
-            _directory = []
-            for result in _paginate:
-                common_prefixes = result.get("CommonPrefixes", ())
-                for prefix in common_prefixes:
-                    _prefix = prefix.get("Prefix")
-                    _name = _prefix[prefix_len:]
-                    if _name:
-                        _directory.append(_name.rstrip(self.delimiter))
-                for obj in result.get("Contents", ()):
-                    name = obj["Key"][prefix_len:]
-                    if name:
-                        _directory.append(name)
+        delimiter = self.delimiter
+        delimiter_len = len(delimiter)
+        _directory = []
+        append = _directory.append
+        for common_prefixes, contents in self._iter_keys(
+            path, _s3_key, delimiter=delimiter
+        ):
+            for prefix in common_prefixes:
+                # A common prefix ends with exactly one delimiter
+                _name = prefix["Prefix"][prefix_len:-delimiter_len]
+                if _name:
+                    append(_name)
+            for obj in contents:
+                name = obj["Key"][prefix_len:]
+                if name:
+                    append(name)
 
         if not _directory:
             if not self.getinfo(_path).is_dir:
@@ -503,21 +987,22 @@ class S3FS(FS):
         _path = self.validatepath(path)
         _key = self._path_to_dir_key(_path)
 
-        if not self.isdir(dirname(_path)):
-            raise errors.ResourceNotFound(path)
-
+        # An existing path proves its parent exists, so look it up first
         try:
             self._getinfo(path)
         except errors.ResourceNotFound:
-            pass
+            if not self.isdir(dirname(_path)):
+                raise errors.ResourceNotFound(path)
         else:
             if recreate:
                 return self.opendir(_path)
             else:
                 raise errors.DirectoryExists(path)
         with s3errors(path):
-            _obj = self.s3.Object(self._bucket_name, _key)
-            _obj.put(**self._get_upload_args(_key))
+            self.client.put_object(
+                Bucket=self._bucket_name, Key=_key, **self._get_upload_args(_key)
+            )
+        self._invalidate(_key)
         return SubFS(self, path)
 
     def openbin(self, path, mode="r", buffering=-1, **options):
@@ -532,45 +1017,22 @@ class S3FS(FS):
             def on_close_create(s3file):
                 """Called when the S3 file closes, to upload data."""
                 try:
-                    s3file.raw.seek(0)
-                    with s3errors(path):
-                        self.client.upload_fileobj(
-                            s3file.raw,
-                            self._bucket_name,
-                            _key,
-                            ExtraArgs=self._get_upload_args(_key),
-                        )
+                    self._upload_file(path, _key, s3file.raw)
                 finally:
                     s3file.raw.close()
 
-            try:
-                dir_path = dirname(_path)
-                if dir_path != "/":
-                    _dir_key = self._path_to_dir_key(dir_path)
-                    self._get_object(dir_path, _dir_key)
-            except errors.ResourceNotFound:
-                raise errors.ResourceNotFound(path)
-
-            try:
-                info = self._getinfo(path)
-            except errors.ResourceNotFound:
-                pass
-            else:
-                if _mode.exclusive:
-                    raise errors.FileExists(path)
-                if info.is_dir:
-                    raise errors.FileExpected(path)
-
-            s3file = S3File.factory(path, _mode, on_close=on_close_create)
+            self._check_file_destination(path, exclusive=_mode.exclusive)
+            s3file = S3File.factory(
+                path,
+                _mode,
+                on_close=on_close_create,
+                spool_size=self.spool_size,
+                temp_dir=self._next_cache_dir(),
+            )
             if _mode.appending:
                 try:
                     with s3errors(path):
-                        self.client.download_fileobj(
-                            self._bucket_name,
-                            _key,
-                            s3file.raw,
-                            ExtraArgs=self.download_args,
-                        )
+                        self._download_file(_key, s3file.raw)
                 except errors.ResourceNotFound:
                     pass
                 else:
@@ -587,22 +1049,19 @@ class S3FS(FS):
             """Called when the S3 file closes, to upload the data."""
             try:
                 if _mode.writing:
-                    s3file.raw.seek(0, os.SEEK_SET)
-                    with s3errors(path):
-                        self.client.upload_fileobj(
-                            s3file.raw,
-                            self._bucket_name,
-                            _key,
-                            ExtraArgs=self._get_upload_args(_key),
-                        )
+                    self._upload_file(path, _key, s3file.raw)
             finally:
                 s3file.raw.close()
 
-        s3file = S3File.factory(path, _mode, on_close=on_close)
+        s3file = S3File.factory(
+            path,
+            _mode,
+            on_close=on_close,
+            spool_size=self.spool_size,
+            temp_dir=self._next_cache_dir(),
+        )
         with s3errors(path):
-            self.client.download_fileobj(
-                self._bucket_name, _key, s3file.raw, ExtraArgs=self.download_args
-            )
+            self._download_file(_key, s3file.raw)
         s3file.seek(0, os.SEEK_SET)
         return s3file
 
@@ -615,19 +1074,22 @@ class S3FS(FS):
             if info.is_dir:
                 raise errors.FileExpected(path)
         self.client.delete_object(Bucket=self._bucket_name, Key=_key)
+        self._invalidate(_key)
 
     def isempty(self, path):
         self.check()
         _path = self.validatepath(path)
         _key = self._path_to_dir_key(_path)
-        response = self.client.list_objects(
-            Bucket=self._bucket_name, Prefix=_key, MaxKeys=2
-        )
-        contents = response.get("Contents", ())
-        for obj in contents:
-            if obj["Key"] != _key:
-                return False
-        return True
+        # Start after the directory's own marker, so any key means not empty
+        with s3errors(path):
+            response = self.client.list_objects_v2(
+                Bucket=self._bucket_name,
+                Prefix=_key,
+                StartAfter=_key,
+                MaxKeys=1,
+                FetchOwner=False,
+            )
+        return not response.get("Contents")
 
     def removedir(self, path):
         self.check()
@@ -641,24 +1103,119 @@ class S3FS(FS):
             raise errors.DirectoryNotEmpty(path)
         _key = self._path_to_dir_key(_path)
         self.client.delete_object(Bucket=self._bucket_name, Key=_key)
+        self._invalidate(_key)
+
+    def removetree(self, dir_path):
+        self.check()
+        _path = self.validatepath(dir_path)
+        info = self.getinfo(_path)
+        if not info.is_dir:
+            raise errors.DirectoryExpected(dir_path)
+        _key = self._path_to_dir_key(_path)
+
+        def iter_keys():
+            for _, contents in self._iter_keys(dir_path, _key):
+                for obj in contents:
+                    # The root directory itself is never removed
+                    if _path != "/" or obj["Key"] != _key:
+                        yield obj["Key"]
+
+        try:
+            self._bulk_delete(dir_path, iter_keys())
+        finally:
+            # Some keys may be gone even if a batch failed
+            with self._lookups_lock:
+                self._info_cache.clear()
+                self._lookups.clear()
+
+    def _iter_keys(self, path, prefix, delimiter=None):
+        """List the keys under a prefix, a page at a time.
+
+        Yields the common prefixes and objects from each page, so callers
+        that stop early don't fetch the remaining pages.
+
+        """
+        params = {}
+        if delimiter is not None:
+            params["Delimiter"] = delimiter
+        paginator = self.client.get_paginator("list_objects_v2")
+        with s3errors(path):
+            for result in paginator.paginate(
+                Bucket=self._bucket_name,
+                Prefix=prefix,
+                FetchOwner=False,
+                PaginationConfig={"PageSize": 1000},
+                **params
+            ):
+                yield result.get("CommonPrefixes", ()), result.get("Contents", ())
+
+    def _bulk_delete(self, path, keys):
+        """Delete keys in batches of 1000, the most DeleteObjects accepts."""
+
+        def delete_batch(batch):
+            with s3errors(path):
+                response = self.client.delete_objects(
+                    Bucket=self._bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            for error in response.get("Errors", ()):
+                raise errors.OperationFailed(
+                    path=path,
+                    msg="failed to delete '{}' ({})".format(
+                        error.get("Key"), error.get("Message")
+                    ),
+                )
+
+        # Wait for the oldest batch once every worker is busy, so batches
+        # are listed no faster than they can be deleted
+        futures = deque()
+        keys = iter(keys)
+        while True:
+            batch = list(itertools.islice(keys, 1000))
+            if not batch:
+                break
+            if len(futures) >= self.max_workers:
+                futures.popleft().result()
+            futures.append(self._executor.submit(delete_batch, batch))
+        for future in futures:
+            future.result()
 
     def setinfo(self, path, info):
         self.getinfo(path)
 
     def readbytes(self, path):
         self.check()
+        size = None
         if self.strict:
-            info = self.getinfo(path)
+            info = self.getinfo(path, namespaces=["details"])
             if not info.is_file:
                 raise errors.FileExpected(path)
+            size = info.size
         _path = self.validatepath(path)
         _key = self._path_to_key(_path)
-        bytes_file = io.BytesIO()
+        if size is not None and size > self._download_config.multipart_threshold:
+            # Large enough to be worth fetching in concurrent ranges, which
+            # are written straight in to a buffer of the expected size
+            buffer = bytearray(size)
+            buffer_file = _BufferFile(buffer)
+            try:
+                with s3errors(path):
+                    self._download_file(_key, buffer_file)
+            except ValueError:
+                # The object grew since it was looked up
+                bytes_file = io.BytesIO()
+                with s3errors(path):
+                    self._download_file(_key, bytes_file)
+                return bytes_file.getvalue()
+            if buffer_file.end < size:
+                # The object shrank since it was looked up
+                return bytes(memoryview(buffer)[: buffer_file.end])
+            return bytes(buffer)
         with s3errors(path):
-            self.client.download_fileobj(
-                self._bucket_name, _key, bytes_file, ExtraArgs=self.download_args
+            response = self.client.get_object(
+                Bucket=self._bucket_name, Key=_key, **(self.download_args or {})
             )
-        return bytes_file.getvalue()
+            return response["Body"].read()
 
     def download(self, path, file, chunk_size=None, **options):
         self.check()
@@ -669,9 +1226,7 @@ class S3FS(FS):
         _path = self.validatepath(path)
         _key = self._path_to_key(_path)
         with s3errors(path):
-            self.client.download_fileobj(
-                self._bucket_name, _key, file, ExtraArgs=self.download_args
-            )
+            self._download_file(_key, file)
 
     def exists(self, path):
         self.check()
@@ -696,32 +1251,31 @@ class S3FS(FS):
         if not info.is_dir:
             raise errors.DirectoryExpected(path)
 
-        paginator = self.client.get_paginator("list_objects")
-        _paginate = paginator.paginate(
-            Bucket=self._bucket_name, Prefix=_s3_key, Delimiter=self.delimiter
-        )
+        delimiter_len = len(self.delimiter)
+        load_s3 = "s3" in namespaces
+        info_from_list_entry = self._info_from_list_entry
 
         def gen_info():
-            for result in _paginate:
-                common_prefixes = result.get("CommonPrefixes", ())
+            for common_prefixes, contents in self._iter_keys(
+                path, _s3_key, delimiter=self.delimiter
+            ):
                 for prefix in common_prefixes:
-                    _prefix = prefix.get("Prefix")
-                    _name = _prefix[prefix_len:]
+                    _name = prefix["Prefix"][prefix_len:-delimiter_len]
                     if _name:
-                        info = {
-                            "basic": {
-                                "name": _name.rstrip(self.delimiter),
-                                "is_dir": True,
-                            }
-                        }
-                        yield Info(info)
-                for _obj in result.get("Contents", ()):
-                    name = _obj["Key"][prefix_len:]
-                    if name:
-                        with s3errors(path):
-                            obj = self.s3.Object(self._bucket_name, _obj["Key"])
-                        info = self._info_from_object(obj, namespaces)
-                        yield Info(info)
+                        yield Info({"basic": {"name": _name, "is_dir": True}})
+                if load_s3:
+                    # The s3 namespace needs headers only HeadObject returns,
+                    # so fetch them for the page's objects concurrently.
+                    keys = [
+                        _obj["Key"] for _obj in contents if _obj["Key"][prefix_len:]
+                    ]
+                    load = functools.partial(self._load_object, path)
+                    for obj in self._executor.map(load, keys):
+                        yield Info(self._info_from_head_response(obj, namespaces))
+                else:
+                    for _obj in contents:
+                        if _obj["Key"][prefix_len:]:
+                            yield Info(info_from_list_entry(_obj, namespaces))
 
         iter_info = iter(gen_info())
         if page is not None:
@@ -738,64 +1292,62 @@ class S3FS(FS):
         _path = self.validatepath(path)
         _key = self._path_to_key(_path)
         if self.strict:
-            if not self.isdir(dirname(path)):
-                raise errors.ResourceNotFound(path)
-            try:
-                info = self._getinfo(path)
-                if info.is_dir:
-                    raise errors.FileExpected(path)
-            except errors.ResourceNotFound:
-                pass
+            self._check_file_destination(path)
 
-        bytes_file = io.BytesIO(contents)
-        with s3errors(path):
-            self.client.upload_fileobj(
-                bytes_file,
-                self._bucket_name,
-                _key,
-                ExtraArgs=self._get_upload_args(_key),
-            )
+        if len(contents) < self._transfer_config.multipart_threshold:
+            with s3errors(path):
+                self.client.put_object(
+                    Bucket=self._bucket_name,
+                    Key=_key,
+                    Body=contents,
+                    **self._get_upload_args(_key)
+                )
+            self._invalidate(_key)
+        else:
+            self._upload_file(path, _key, io.BytesIO(contents))
 
     def upload(self, path, file, chunk_size=None, **options):
         _path = self.validatepath(path)
         _key = self._path_to_key(_path)
 
         if self.strict:
-            if not self.isdir(dirname(path)):
-                raise errors.ResourceNotFound(path)
-            try:
-                info = self._getinfo(path)
-                if info.is_dir:
-                    raise errors.FileExpected(path)
-            except errors.ResourceNotFound:
-                pass
+            self._check_file_destination(path)
 
         with s3errors(path):
-            self.client.upload_fileobj(
-                file, self._bucket_name, _key, ExtraArgs=self._get_upload_args(_key)
-            )
+            self._transfer_manager(self._transfer_config).upload(
+                file, self._bucket_name, _key, extra_args=self._get_upload_args(_key)
+            ).result()
+        self._invalidate(_key)
 
     def copy(self, src_path, dst_path, overwrite=False):
-        if not overwrite and self.exists(dst_path):
-            raise errors.DestinationExists(dst_path)
         _src_path = self.validatepath(src_path)
         _dst_path = self.validatepath(dst_path)
-        if self.strict:
-            if not self.isdir(dirname(_dst_path)):
-                raise errors.ResourceNotFound(dst_path)
+        if not overwrite or self.strict:
+            try:
+                self._getinfo(_dst_path)
+            except errors.ResourceNotFound:
+                if self.strict and not self.isdir(dirname(_dst_path)):
+                    raise errors.ResourceNotFound(dst_path)
+            else:
+                if not overwrite:
+                    raise errors.DestinationExists(dst_path)
         _src_key = self._path_to_key(_src_path)
         _dst_key = self._path_to_key(_dst_path)
-        try:
-            with s3errors(src_path):
+        src_obj = self._get_object(src_path, _src_key)
+        if src_obj["Key"].endswith(self.delimiter):
+            raise errors.FileExpected(src_path)
+        copy_source = {"Bucket": self._bucket_name, "Key": _src_key}
+        with s3errors(src_path):
+            if src_obj["Size"] > self._copy_config.multipart_threshold:
+                # CopyObject is limited to 5GiB, so copy large objects in parts
+                self._transfer_manager(self._copy_config).copy(
+                    copy_source, self._bucket_name, _dst_key
+                ).result()
+            else:
                 self.client.copy_object(
-                    Bucket=self._bucket_name,
-                    Key=_dst_key,
-                    CopySource={"Bucket": self._bucket_name, "Key": _src_key},
+                    Bucket=self._bucket_name, Key=_dst_key, CopySource=copy_source
                 )
-        except errors.ResourceNotFound:
-            if self.exists(src_path):
-                raise errors.FileExpected(src_path)
-            raise
+        self._invalidate(_dst_key)
 
     def move(self, src_path, dst_path, overwrite=False):
         self.copy(src_path, dst_path, overwrite=overwrite)
@@ -1,15 +1,44 @@
 from __future__ import unicode_literals
 
+from concurrent.futures import Future
+from datetime import datetime
+import gc
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
 from nose.plugins.attrib import attr
+import six
 
+from fs import errors
+from fs.mode import Mode
 from fs.test import FSTestCases
 from fs_s3fs import S3FS
+from fs_s3fs import _s3fs
+from fs_s3fs._s3fs import S3File, _BufferFile, _InfoCache
 
 import boto3
 
 
+def delete_bucket_contents(client, bucket_name):
+    """Delete every object in a bucket, up to 1000 per request."""
+    paginator = client.get_paginator("list_objects_v2")
+    for result in paginator.paginate(Bucket=bucket_name):
+        contents = result.get("Contents", ())
+        if contents:
+            client.delete_objects(
+                Bucket=bucket_name,
+                Delete={
+                    "Objects": [{"Key": obj["Key"]} for obj in contents],
+                    "Quiet": True,
+                },
+            )
+
+
 class TestS3FS(FSTestCases, unittest.TestCase):
     """Test S3FS implementation from dir_path."""
 
@@ -22,10 +51,7 @@ class TestS3FS(FSTestCases, unittest.TestCase):
         return S3FS(self.bucket_name)
 
     def _delete_bucket_contents(self):
-        response = self.client.list_objects(Bucket=self.bucket_name)
-        contents = response.get("Contents", ())
-        for obj in contents:
-            self.client.delete_object(Bucket=self.bucket_name, Key=obj["Key"])
+        delete_bucket_contents(self.client, self.bucket_name)
 
 
 @attr("slow")
@@ -42,10 +68,79 @@ class TestS3FSSubDir(FSTestCases, unittest.TestCase):
         return S3FS(self.bucket_name, dir_path="subdirectory")
 
     def _delete_bucket_contents(self):
-        response = self.client.list_objects(Bucket=self.bucket_name)
-        contents = response.get("Contents", ())
-        for obj in contents:
-            self.client.delete_object(Bucket=self.bucket_name, Key=obj["Key"])
+        delete_bucket_contents(self.client, self.bucket_name)
+
+
+class TestS3File(unittest.TestCase):
+    def test_readinto(self):
+        for f in (io.BytesIO(), tempfile.SpooledTemporaryFile()):
+            f.write(b"Hello, World")
+            f.seek(0)
+            s3file = S3File(f, "test.txt", Mode("rb"))
+            buffer = bytearray(5)
+            self.assertEqual(s3file.readinto(buffer), 5)
+            self.assertEqual(buffer, b"Hello")
+            f.close()
+
+    def test_readinto_write_only(self):
+        s3file = S3File(io.BytesIO(), "test.txt", Mode("wb"))
+        with self.assertRaises(IOError):
+            s3file.readinto(bytearray(5))
+
+    def test_factory_spool_size(self):
+        s3file = S3File.factory("test.txt", Mode("wb"), None, spool_size=4)
+        s3file.write(b"Hell")
+        self.assertFalse(s3file.raw._rolled)
+        s3file.write(b"o")
+        self.assertTrue(s3file.raw._rolled)
+        s3file.raw.close()
+
+    def test_factory_temp_dir(self):
+        temp_dir = os.path.realpath(tempfile.mkdtemp())
+        s3file = S3File.factory(
+            "test.txt", Mode("wb"), None, spool_size=4, temp_dir=temp_dir
+        )
+        try:
+            s3file.write(b"Hello")
+            self.assertTrue(s3file.raw._rolled)
+            # The spilled file is unlinked, so find its path from the fd
+            fd_path = "/proc/self/fd/{}".format(s3file.raw.fileno())
+            if not os.path.exists(fd_path):
+                self.skipTest("no /proc to find open files' paths")
+            self.assertEqual(os.path.dirname(os.readlink(fd_path)), temp_dir)
+        finally:
+            s3file.raw.close()
+            os.rmdir(temp_dir)
+
+
+class TestBufferFile(unittest.TestCase):
+    def test_write(self):
+        buffer = bytearray(10)
+        buffer_file = _BufferFile(buffer)
+        buffer_file.seek(5)
+        self.assertEqual(buffer_file.write(b"World"), 5)
+        buffer_file.seek(0)
+        buffer_file.write(b"Hello")
+        self.assertEqual(buffer, b"HelloWorld")
+        self.assertEqual(buffer_file.end, 10)
+        with self.assertRaises(ValueError):
+            buffer_file.write(b"!" * 11)
+
+
+class StubClient(object):
+    """A client that returns canned list objects responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def list_objects_v2(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.responses.pop(0)
+
+    def delete_objects(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.responses.pop(0)
 
 
 class TestS3FSHelpers(unittest.TestCase):
@@ -59,6 +154,62 @@ class TestS3FSHelpers(unittest.TestCase):
         self.assertEqual(s3._path_to_key("foo.bar"), "dir/foo.bar")
         self.assertEqual(s3._path_to_key("foo/bar"), "dir/foo/bar")
 
+    def test_path_to_key_normal_path(self):
+        s3 = S3FS("foo", "/dir")
+        self.assertEqual(s3._path_to_key("/foo/bar"), "dir/foo/bar")
+        self.assertEqual(s3._path_to_key("/foo/../bar"), "dir/bar")
+        self.assertEqual(s3._path_to_dir_key("/foo/bar"), "dir/foo/bar/")
+        self.assertEqual(s3._path_to_dir_key("/foo/./bar/"), "dir/foo/bar/")
+
+    def test_validatepath_cached(self):
+        s3 = S3FS("foo")
+        self.assertEqual(s3.validatepath("foo/./bar"), "/foo/bar")
+        self.assertEqual(s3._valid_paths["foo/./bar"], "/foo/bar")
+        self.assertEqual(s3.validatepath("foo/./bar"), "/foo/bar")
+        with self.assertRaises(TypeError):
+            s3.validatepath(b"foo/./bar")
+        with self.assertRaises(errors.InvalidCharsInPath):
+            s3.validatepath("foo\0")
+        s3.close()
+        with self.assertRaises(errors.FilesystemClosed):
+            s3.validatepath("foo/./bar")
+
+    def test_next_cache_dir(self):
+        self.assertIsNone(S3FS("foo")._next_cache_dir())
+        temp_dirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        try:
+            s3 = S3FS("foo", cache_dirs=temp_dirs)
+            cache_dirs = [s3._next_cache_dir() for _ in range(3)]
+            self.assertEqual(cache_dirs, temp_dirs + temp_dirs[:1])
+            with self.assertRaises(errors.CreateFailed):
+                S3FS("foo", cache_dirs=[os.path.join(temp_dirs[0], "missing")])
+        finally:
+            for temp_dir in temp_dirs:
+                os.rmdir(temp_dir)
+
+    def test_bad_cache_dirs(self):
+        temp_dir = tempfile.mkdtemp()
+        os.rmdir(temp_dir)
+        stderr = sys.stderr
+        sys.stderr = captured = six.StringIO()
+        try:
+            try:
+                S3FS("foo", cache_dirs=[temp_dir])
+            except errors.CreateFailed:
+                pass
+            else:
+                self.fail("CreateFailed not raised")
+            gc.collect()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(captured.getvalue(), "")
+
+    def test_path_to_key_delimiter(self):
+        s3 = S3FS("foo", "/dir", delimiter=":")
+        self.assertEqual(s3._path_to_key("foo/bar"), "dir:foo:bar")
+        self.assertEqual(s3._path_to_dir_key("foo/bar"), "dir:foo:bar:")
+        self.assertEqual(s3._key_to_path("dir:foo:bar"), "dir/foo/bar")
+
     def test_upload_args(self):
         s3 = S3FS("foo", acl="acl", cache_control="cc")
         self.assertDictEqual(
@@ -77,3 +228,314 @@ class TestS3FSHelpers(unittest.TestCase):
             s3._get_upload_args("unknown.unknown"),
             {"ACL": "acl", "CacheControl": "cc", "ContentType": "binary/octet-stream"},
         )
+
+    def test_info_from_list_entry(self):
+        s3 = S3FS("foo", "/dir")
+        entry = {
+            "Key": "dir/foo/bar.txt",
+            "Size": 42,
+            "LastModified": datetime(2019, 1, 1),
+            "ETag": '"etag"',
+            "StorageClass": "STANDARD",
+        }
+        info = s3._info_from_list_entry(entry, ["details"])
+        self.assertEqual(info["basic"], {"name": "bar.txt", "is_dir": False})
+        self.assertEqual(info["details"]["size"], 42)
+        self.assertEqual(info["details"]["modified"], 1546300800)
+
+    def test_info_from_list_entry_implied_dir(self):
+        s3 = S3FS("foo")
+        info = s3._info_from_list_entry({"Key": "foo/"}, ["details", "s3"])
+        self.assertEqual(info["basic"], {"name": "foo", "is_dir": True})
+        self.assertIsNone(info["details"]["modified"])
+        self.assertEqual(info["details"]["size"], 0)
+        self.assertIsNone(info["s3"]["e_tag"])
+
+    def test_info_cache(self):
+        cache = _InfoCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        cache.pop("a")
+        self.assertIsNone(cache.get("a"))
+
+    def test_info_cache_disabled(self):
+        cache = _InfoCache(maxsize=2, ttl=0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_invalidate(self):
+        s3 = S3FS("foo")
+        for key in ("a", "a/b", "a/b/c", "a/bc"):
+            s3._info_cache.set(key, {"Key": key})
+        s3._invalidate("a/b/c")
+        self.assertIsNone(s3._info_cache.get("a/b/c"))
+        self.assertIsNone(s3._info_cache.get("a/b"))
+        self.assertIsNone(s3._info_cache.get("a"))
+        self.assertEqual(s3._info_cache.get("a/bc"), {"Key": "a/bc"})
+
+    def test_getinfo_dir_modified(self):
+        s3 = S3FS("foo")
+        modified = datetime(2019, 1, 1)
+        s3._S3FS__client = StubClient(
+            {"CommonPrefixes": [{"Prefix": "a/"}]},
+            {"Contents": [{"Key": "a/", "Size": 0, "LastModified": modified}]},
+        )
+        info = s3.getinfo("a", ["details"])
+        self.assertEqual(info.raw["details"]["modified"], 1546300800)
+        s3._S3FS__client = StubClient(
+            {"CommonPrefixes": [{"Prefix": "b/"}]}, {"Contents": [{"Key": "b/c"}]}
+        )
+        self.assertIsNone(s3.getinfo("b", ["details"]).modified)
+
+    def test_get_client_bounded(self):
+        first = _s3fs._get_client(region_name="us-east-1", aws_session_token="0")
+        self.assertIs(
+            _s3fs._get_client(region_name="us-east-1", aws_session_token="0"), first
+        )
+        for token in range(1, _s3fs._MAX_CLIENTS + 1):
+            _s3fs._get_client(region_name="us-east-1", aws_session_token=str(token))
+        self.assertLessEqual(len(_s3fs._clients), _s3fs._MAX_CLIENTS)
+        self.assertIsNot(
+            _s3fs._get_client(region_name="us-east-1", aws_session_token="0"), first
+        )
+
+    def test_get_client_default_session(self):
+        session = boto3.DEFAULT_SESSION
+        boto3.setup_default_session(region_name="eu-west-1")
+        try:
+            self.assertEqual(S3FS("foo").client.meta.region_name, "eu-west-1")
+        finally:
+            boto3.DEFAULT_SESSION = session
+            # Don't leave clients of this session for other tests
+            with _s3fs._clients_lock:
+                _s3fs._clients.clear()
+
+    def test_lookup_object(self):
+        s3 = S3FS("foo")
+        modified = datetime(2019, 1, 1)
+        file_entry = {"Key": "a", "Size": 1, "LastModified": modified}
+
+        # File
+        s3._S3FS__client = StubClient({"Contents": [file_entry]})
+        self.assertEqual(s3._lookup_object("/a", "a"), file_entry)
+
+        # Directory
+        s3._S3FS__client = StubClient({"CommonPrefixes": [{"Prefix": "a/"}]})
+        self.assertEqual(s3._lookup_object("/a", "a"), {"Key": "a/"})
+
+        # Directory listed after siblings that sort ahead of it
+        marker = {"Key": "a/", "Size": 0, "LastModified": modified}
+        s3._S3FS__client = client = StubClient(
+            {
+                "Contents": [{"Key": "a-b"}, {"Key": "a.txt"}],
+                "IsTruncated": True,
+            },
+            {"Contents": [marker]},
+        )
+        self.assertEqual(s3._lookup_object("/a", "a"), marker)
+        self.assertEqual(client.calls[1]["Prefix"], "a/")
+
+        # Implied directory listed after siblings
+        s3._S3FS__client = StubClient(
+            {"Contents": [{"Key": "a-b"}, {"Key": "a.txt"}], "IsTruncated": True},
+            {"Contents": [{"Key": "a/b"}]},
+        )
+        self.assertEqual(s3._lookup_object("/a", "a"), {"Key": "a/"})
+
+        # Missing
+        s3._S3FS__client = StubClient(
+            {"Contents": [{"Key": "a-b"}, {"Key": "a.txt"}], "IsTruncated": True},
+            {},
+        )
+        with self.assertRaises(errors.ResourceNotFound):
+            s3._lookup_object("/a", "a")
+
+    def test_bulk_delete(self):
+        s3 = S3FS("foo", max_workers=1)
+        s3._S3FS__client = client = StubClient({}, {}, {})
+        s3._bulk_delete("/", ("key{}".format(i) for i in range(2500)))
+        self.assertEqual(
+            [len(call["Delete"]["Objects"]) for call in client.calls],
+            [1000, 1000, 500],
+        )
+        s3._S3FS__client = StubClient({"Errors": [{"Key": "a", "Message": "No"}]})
+        with self.assertRaises(errors.OperationFailed):
+            s3._bulk_delete("/", ["a"])
+        s3.close()
+
+    def test_get_object_coalesced(self):
+        s3 = S3FS("foo", info_cache_ttl=0)
+        calls = []
+
+        def lookup_object(path, key):
+            calls.append(key)
+            time.sleep(0.1)
+            return {"Key": key}
+
+        s3._lookup_object = lookup_object
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(s3._get_object("/a", "a"))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(results, [{"Key": "a"}] * 5)
+        self.assertEqual(s3._lookups, {})
+
+    def test_get_object_coalesced_errors(self):
+        s3 = S3FS("foo", info_cache_ttl=0)
+        s3._lookup_object = lambda path, key: {"Key": key}
+
+        def wait_for(future):
+            s3._lookups["a"] = future
+            results = []
+
+            def get_object():
+                try:
+                    results.append(s3._get_object("/a", "a"))
+                except errors.ResourceNotFound as error:
+                    results.append(error)
+
+            thread = threading.Thread(target=get_object)
+            thread.start()
+            time.sleep(0.1)
+            del s3._lookups["a"]
+            return thread, results
+
+        # Waiting threads raise their own error, with their own path
+        future = Future()
+        thread, results = wait_for(future)
+        future.set_exception(errors.ResourceNotFound("/b/../a"))
+        thread.join()
+        self.assertIsInstance(results[0], errors.ResourceNotFound)
+        self.assertEqual(results[0].path, "/a")
+
+        # Waiting threads look up the key when the leader is interrupted
+        future = Future()
+        thread, results = wait_for(future)
+        future.set_result(None)
+        thread.join()
+        self.assertEqual(results, [{"Key": "a"}])
+
+        class Interrupt(BaseException):
+            pass
+
+        def interrupted_lookup(path, key):
+            raise Interrupt()
+
+        s3._lookup_object = interrupted_lookup
+        with self.assertRaises(Interrupt):
+            s3._get_object("/a", "a")
+        self.assertEqual(s3._lookups, {})
+
+    def test_get_object_invalidated(self):
+        s3 = S3FS("foo")
+        started = threading.Event()
+        release = threading.Event()
+        sizes = iter([1, 2])
+
+        def lookup_object(path, key):
+            size = next(sizes)
+            if size == 1:
+                started.set()
+                release.wait(5)
+            return {"Key": key, "Size": size}
+
+        s3._lookup_object = lookup_object
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(s3._get_object("/a", "a"))
+        )
+        thread.start()
+        started.wait()
+        s3._invalidate("a")
+        # A lookup after the change doesn't join the one before it
+        self.assertEqual(s3._get_object("/a", "a")["Size"], 2)
+        release.set()
+        thread.join()
+        self.assertEqual(results[0]["Size"], 1)
+        self.assertEqual(s3._get_object("/a", "a")["Size"], 2)
+
+    def test_get_object_not_found(self):
+        s3 = S3FS("foo")
+        calls = []
+
+        def lookup_object(path, key):
+            calls.append(key)
+            raise errors.ResourceNotFound(path)
+
+        s3._lookup_object = lookup_object
+        for _ in range(2):
+            with self.assertRaises(errors.ResourceNotFound):
+                s3._get_object("/a/b", "a/b")
+        self.assertEqual(calls, ["a/b", "a/b"])
+
+    def test_get_object_not_found_cached(self):
+        s3 = S3FS("foo", cache_not_found=True)
+        calls = []
+
+        def lookup_object(path, key):
+            calls.append(key)
+            raise errors.ResourceNotFound(path)
+
+        s3._lookup_object = lookup_object
+        for _ in range(2):
+            with self.assertRaises(errors.ResourceNotFound):
+                s3._get_object("/a/b", "a/b")
+        self.assertEqual(calls, ["a/b"])
+        s3._invalidate("a/b/c")
+        with self.assertRaises(errors.ResourceNotFound):
+            s3._get_object("/a/b", "a/b")
+        self.assertEqual(calls, ["a/b", "a/b"])
+
+    def test_transfer_manager_reused(self):
+        s3 = S3FS("foo", region="us-east-1")
+        manager = s3._transfer_manager(s3._transfer_config)
+        self.assertIs(s3._transfer_manager(s3._transfer_config), manager)
+        self.assertIsNot(s3._transfer_manager(s3._download_config), manager)
+        s3.close()
+        self.assertEqual(s3._transfer_managers, {})
+
+    def test_copy_multipart(self):
+        s3 = S3FS("foo", strict=False)
+        self.assertEqual(s3._copy_config.preferred_transfer_client, "classic")
+        s3._copy_config.multipart_threshold = 4
+        s3._info_cache.set("a", {"Key": "a", "Size": 5})
+        copies = []
+
+        class TransferManager(object):
+            def copy(self, copy_source, bucket, key):
+                copies.append((copy_source, bucket, key))
+                future = Future()
+                future.set_result(None)
+                return future
+
+        s3._transfer_manager = lambda config: TransferManager()
+        s3.copy("a", "b", overwrite=True)
+        self.assertEqual(copies, [({"Bucket": "foo", "Key": "a"}, "foo", "b")])
+
+    def test_info_from_head_response(self):
+        s3 = S3FS("foo")
+        obj = {
+            "Key": "foo/bar.txt",
+            "ContentLength": 42,
+            "ContentType": "text/plain",
+            "LastModified": datetime(2019, 1, 1),
+            "Metadata": {},
+        }
+        info = s3._info_from_head_response(obj, ["details", "s3"])
+        self.assertEqual(info["details"]["size"], 42)
+        self.assertEqual(info["s3"]["content_type"], "text/plain")
+        self.assertEqual(info["s3"]["last_modified"], 1546300800)
+        self.assertIsNone(info["s3"]["e_tag"])
+        self.assertEqual(len(info["s3"]), len(S3FS._S3_ATTR_TABLE))
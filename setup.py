@@ -23,7 +23,12 @@ CLASSIFIERS = [
 with open("README.rst", "rt") as f:
     DESCRIPTION = f.read()
 
-REQUIREMENTS = ["boto3~=1.9", "fs~=2.4", "six~=1.10"]
+REQUIREMENTS = [
+    "boto3~=1.12",
+    "fs~=2.4",
+    "six~=1.10",
+    "futures~=3.2; python_version < '3'",
+]
 
 setup(
     name="fs-s3fs",
@@ -32,6 +37,7 @@ setup(
     classifiers=CLASSIFIERS,
     description="Amazon S3 filesystem for PyFilesystem2",
     install_requires=REQUIREMENTS,
+    extras_require={"crt": ["boto3[crt]"]},
     license="MIT",
     long_description=DESCRIPTION,
     packages=find_packages(),